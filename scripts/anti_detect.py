@@ -4,102 +4,112 @@ Anti-detection utilities for web scraping
 """
 import random
 import time
-from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
 import pyautogui
 
+# 봇 감지 회피 스크립트
+# - webdriver 속성 숨기기, Plugin 배열 / Language 설정 (defineProperties 한 번)
+# - Chrome 관련 속성 숨기기
+# - Permission 관련 수정
+_STEALTH_JS_RAW = '''
+    Object.defineProperties(navigator, {
+        webdriver: { get: () => undefined },
+        plugins: { get: () => [1, 2, 3, 4, 5] },
+        languages: { get: () => ['ko-KR', 'ko', 'en-US', 'en'] }
+    });
+    window.chrome = { runtime: {} };
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: Notification.permission }) :
+            originalQuery(parameters)
+    );
+'''
+
+# 모듈 로드시 한 번만 압축하고 CDP 요청 payload도 미리 생성
+_STEALTH_JS = ' '.join(line.strip() for line in _STEALTH_JS_RAW.splitlines() if line.strip())
+_STEALTH_CDP_PAYLOAD = {'source': _STEALTH_JS}
+
 class AntiDetect:
-    def __init__(self):
+    def __init__(self, seed=None):
+        # 인스턴스 전용 난수 생성기 (seed 지정시 재현 가능 - 테스트/리플레이용)
+        self._rng = random.Random(seed)
+        
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         ]
+        self.viewport_sizes = [
+            (1920, 1080),
+            (1366, 768),
+            (1440, 900),
+            (1536, 864),
+            (1280, 720)
+        ]
+        
+        # 세션 동안 고정 (TLS 세션 재개/연결 재사용에 유리)
+        self.rotate()
+    
+    def rotate(self):
+        """User-Agent/뷰포트 새로 선택"""
+        self._chosen_ua = self._rng.choice(self.user_agents)
+        self._chosen_viewport = self._rng.choice(self.viewport_sizes)
     
     def get_random_user_agent(self):
-        """랜덤 User-Agent 반환"""
-        return random.choice(self.user_agents)
+        """세션용 User-Agent 반환 (rotate() 전까지 동일)"""
+        return self._chosen_ua
+    
+    def chance(self, probability):
+        """probability 확률로 True (행동 여부 결정용)"""
+        return self._rng.random() < probability
     
     def random_delay(self, min_seconds=0.5, max_seconds=2.0):
         """랜덤 지연"""
-        time.sleep(random.uniform(min_seconds, max_seconds))
+        time.sleep(self._rng.uniform(min_seconds, max_seconds))
     
     def human_like_scroll(self, driver):
         """인간처럼 스크롤"""
-        scroll_pause = random.uniform(0.5, 1.5)
+        scroll_pause = self._rng.uniform(0.5, 1.5)
         
-        # 작은 단위로 여러 번 스크롤
-        for _ in range(random.randint(2, 5)):
-            scroll_amount = random.randint(100, 300)
-            driver.execute_script(f"window.scrollBy(0, {scroll_amount})")
-            time.sleep(scroll_pause)
+        # 작은 단위로 여러 번 스크롤 (대기는 브라우저 안에서, CDP 호출 1회)
+        amounts = [self._rng.randint(100, 300) for _ in range(self._rng.randint(2, 5))]
+        script = (
+            f"(async () => {{ for (const d of {amounts}) {{ window.scrollBy(0, d); "
+            f"await new Promise(r => setTimeout(r, {int(scroll_pause * 1000)})); }} }})()"
+        )
+        driver.execute_cdp_cmd('Runtime.evaluate', {'expression': script, 'awaitPromise': True})
     
     def random_mouse_movement(self, driver):
         """랜덤 마우스 움직임"""
-        action = ActionChains(driver)
-        
-        # 화면 내 랜덤 위치로 마우스 이동
-        width = driver.execute_script("return window.innerWidth")
-        height = driver.execute_script("return window.innerHeight")
-        
-        for _ in range(random.randint(2, 4)):
-            x = random.randint(100, width - 100)
-            y = random.randint(100, height - 100)
-            
-            # 부드러운 곡선 움직임
-            action.move_by_offset(x, y)
-            self.random_delay(0.1, 0.3)
+        # 뷰포트 크기를 한 번에 조회
+        result = driver.execute_cdp_cmd('Runtime.evaluate', {
+            'expression': '[window.innerWidth, window.innerHeight]',
+            'returnByValue': True
+        })
+        width, height = result['result']['value']
         
-        action.perform()
+        # 화면 내 랜덤 위치로 마우스 이동 (ActionChains 대신 CDP 직접 전송)
+        points = [
+            (self._rng.randint(100, width - 100), self._rng.randint(100, height - 100))
+            for _ in range(self._rng.randint(2, 4))
+        ]
+        for x, y in points:
+            driver.execute_cdp_cmd('Input.dispatchMouseEvent', {
+                'type': 'mouseMoved', 'x': x, 'y': y
+            })
     
     def add_stealth_scripts(self, driver):
         """JavaScript를 통한 봇 감지 회피"""
-        # webdriver 속성 숨기기
-        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
-            'source': '''
-                Object.defineProperty(navigator, 'webdriver', {
-                    get: () => undefined
-                });
-                
-                // Chrome 관련 속성 숨기기
-                window.chrome = {
-                    runtime: {}
-                };
-                
-                // Permission 관련 수정
-                const originalQuery = window.navigator.permissions.query;
-                window.navigator.permissions.query = (parameters) => (
-                    parameters.name === 'notifications' ?
-                        Promise.resolve({ state: Notification.permission }) :
-                        originalQuery(parameters)
-                );
-                
-                // Plugin 배열 수정
-                Object.defineProperty(navigator, 'plugins', {
-                    get: () => [1, 2, 3, 4, 5]
-                });
-                
-                // Language 설정
-                Object.defineProperty(navigator, 'languages', {
-                    get: () => ['ko-KR', 'ko', 'en-US', 'en']
-                });
-            '''
-        })
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', _STEALTH_CDP_PAYLOAD)
     
     def get_random_viewport_size(self):
-        """일반적인 화면 크기 중 랜덤 선택"""
-        sizes = [
-            (1920, 1080),
-            (1366, 768),
-            (1440, 900),
-            (1536, 864),
-            (1280, 720)
-        ]
-        return random.choice(sizes)
+        """세션용 화면 크기 반환 (rotate() 전까지 동일)"""
+        return self._chosen_viewport
     
     def random_request_interval(self):
         """10초 기준으로 랜덤하게 변동"""
         base_interval = 10
-        variation = random.uniform(-2, 3)  # 8초~13초
+        variation = self._rng.uniform(-2, 3)  # 8초~13초
         return base_interval + variation
\ No newline at end of file
@@ -2,18 +2,34 @@
 """
 Investing.com USD/KRW crawler with anti-detection
 """
-import json
 import sys
 import os
+import re
 import time
-import random
-from datetime import datetime
+import threading
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException
 import undetected_chromedriver as uc
 from anti_detect import AntiDetect
+from fx_common import (
+    NO_IMAGES_PREFS, RATE_MAX, RATE_MIN, block_heavy_resources, iso_now, json_dumps,
+    json_loads, parse_rate
+)
+
+# 시세 XHR 응답 URL 패턴 (Network.responseReceived 필터)
+QUOTE_XHR_PATTERN = re.compile(r'/api/(?:v2/quotes|financialdata)')
+QUOTE_EVENT_TIMEOUT = 5
+
+# DOM 폴백용 선택자 (하나의 CSS 그룹으로 한 번만 대기)
+RATE_SELECTORS = ', '.join([
+    '[data-test="instrument-price-last"]',
+    '.instrument-price_last__KQzyA',
+    'span[class*="instrument-price"]',
+    '.pid-650-last'
+])
 
 class InvestingCrawler:
     def __init__(self, headless=True):
@@ -23,6 +39,10 @@ class InvestingCrawler:
         self.last_request_time = 0
         self.request_count = 0
         
+        # CDP로 수신한 시세 XHR의 requestId (반복 요청 간 재사용)
+        self.quote_request_id = None
+        self.quote_event = threading.Event()
+        
     def setup_driver(self):
         """Chrome 드라이버 설정"""
         options = uc.ChromeOptions()
@@ -52,29 +72,116 @@ class InvestingCrawler:
         prefs = {
             'webrtc.ip_handling_policy': 'disable_non_proxied_udp',
             'webrtc.multiple_routes_enabled': False,
-            'webrtc.nonproxied_udp_enabled': False
+            'webrtc.nonproxied_udp_enabled': False,
+            **NO_IMAGES_PREFS
         }
         options.add_experimental_option('prefs', prefs)
         
-        # undetected-chromedriver로 생성
-        self.driver = uc.Chrome(options=options, version_main=None)
+        # undetected-chromedriver로 생성 (CDP 이벤트 수신 활성화)
+        self.driver = uc.Chrome(options=options, version_main=None, enable_cdp_events=True)
         
         # Stealth 스크립트 추가
         self.anti_detect.add_stealth_scripts(self.driver)
         
+        # 불필요한 리소스 차단 + 시세 XHR 응답을 CDP 이벤트로 수신
+        block_heavy_resources(self.driver)
+        self.driver.add_cdp_listener('Network.responseReceived', self.on_response_received)
+        self.driver.add_cdp_listener('Network.loadingFinished', self.on_loading_finished)
+        
         # 타임아웃 설정
         self.driver.set_page_load_timeout(30)
         self.driver.implicitly_wait(10)
         
+    def reset_browser_state(self):
+        """브라우저 재시작 없이 캐시/쿠키/스토리지 정리 (메모리 누수 방지)"""
+        self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+        self.driver.execute_cdp_cmd('Storage.clearDataForOrigin', {
+            'origin': 'https://www.investing.com',
+            'storageTypes': 'all'
+        })
+        self.quote_request_id = None
+        
+    def restart_driver(self):
+        """드라이버 강제 재시작 (복구 불가능한 오류시에만)"""
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        self.driver = None
+        self.quote_request_id = None
+        
+    def on_response_received(self, message):
+        """Network.responseReceived 핸들러 - 시세 XHR의 requestId 기록 (헤더 수신 시점)"""
+        params = message.get('params', {})
+        url = params.get('response', {}).get('url', '')
+        if QUOTE_XHR_PATTERN.search(url):
+            self.quote_request_id = params.get('requestId')
+    
+    def on_loading_finished(self, message):
+        """Network.loadingFinished 핸들러 - 시세 XHR 본문 수신 완료 알림
+        
+        완료 전에는 getResponseBody가 'No data found'로 실패함
+        """
+        request_id = message.get('params', {}).get('requestId')
+        if request_id and request_id == self.quote_request_id:
+            self.quote_event.set()
+    
+    def find_last(self, data):
+        """JSON 응답에서 'last' 값 탐색"""
+        if isinstance(data, dict):
+            if 'last' in data:
+                return data['last']
+            values = data.values()
+        elif isinstance(data, list):
+            values = data
+        else:
+            return None
+        
+        for value in values:
+            last = self.find_last(value)
+            if last is not None:
+                return last
+        return None
+    
+    def read_quote_response(self):
+        """CDP로 시세 XHR 응답 본문을 읽어 환율 추출"""
+        if not self.quote_request_id:
+            return None
+        
+        try:
+            response = self.driver.execute_cdp_cmd(
+                'Network.getResponseBody', {'requestId': self.quote_request_id}
+            )
+            last = self.find_last(json_loads(response['body']))
+            if last is None:
+                return None
+            # JSON 숫자는 범위만 확인, 문자열은 파싱 (다른 종목의 'last' 차단)
+            if not isinstance(last, (int, float)):
+                return parse_rate(str(last))
+            rate = float(last)
+            return rate if RATE_MIN < rate < RATE_MAX else None
+        except Exception:
+            # 캐시된 requestId가 만료되었거나 응답 형식이 다름
+            self.quote_request_id = None
+            return None
+    
+    def read_rate_element(self):
+        """DOM에서 환율 추출 (최후의 폴백)"""
+        element = WebDriverWait(self.driver, 5).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, RATE_SELECTORS))
+        )
+        return element.text
+        
     def fetch_usdkrw(self):
         """USD/KRW 환율 크롤링"""
         try:
-            # 드라이버 초기화 (첫 요청 또는 주기적 재시작)
-            if not self.driver or self.request_count % 50 == 0:
-                if self.driver:
-                    self.driver.quit()
+            # 드라이버 초기화 (첫 요청 또는 복구 불가능한 오류 후)
+            if not self.driver:
                 self.setup_driver()
                 time.sleep(2)  # 초기 대기
+            elif self.request_count and self.request_count % 50 == 0:
+                # 주기적 정리 (드라이버는 유지)
+                self.reset_browser_state()
             
             # 요청 간격 체크
             current_time = time.time()
@@ -84,51 +191,46 @@ class InvestingCrawler:
             
             # URL 접속
             url = 'https://www.investing.com/currencies/usd-krw'
+            # 이전 페이지의 requestId로 과거 시세를 읽지 않도록 초기화
+            self.quote_event.clear()
+            self.quote_request_id = None
             self.driver.get(url)
             
-            # 랜덤 대기
-            self.anti_detect.random_delay(2, 4)
+            # 시세 XHR 수신 대기 (도착 즉시 반환)
+            quote_received = self.quote_event.wait(QUOTE_EVENT_TIMEOUT)
             
             # 인간같은 행동 시뮬레이션 (30% 확률)
-            if random.random() < 0.3:
+            if self.anti_detect.chance(0.3):
                 self.anti_detect.human_like_scroll(self.driver)
                 self.anti_detect.random_delay(0.5, 1.5)
                 
                 # 가끔 마우스 움직임 (10% 확률)
-                if random.random() < 0.1:
+                if self.anti_detect.chance(0.1):
                     self.anti_detect.random_mouse_movement(self.driver)
             
-            # 환율 데이터 추출 (여러 선택자 시도)
-            selectors = [
-                '[data-test="instrument-price-last"]',
-                '.instrument-price_last__KQzyA',
-                'span[class*="instrument-price"]',
-                '.pid-650-last'
-            ]
+            # 환율 데이터 추출 (CDP 응답 우선, 실패시 DOM 폴백)
+            rate = self.read_quote_response() if quote_received else None
             
-            rate_text = None
-            for selector in selectors:
+            if rate is None:
                 try:
-                    element = WebDriverWait(self.driver, 5).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                    )
-                    rate_text = element.text
-                    break
-                except:
-                    continue
-            
-            if not rate_text:
-                raise Exception("Rate element not found")
-            
-            # 환율 파싱 (콤마 제거)
-            rate = float(rate_text.replace(',', ''))
+                    rate_text = self.read_rate_element()
+                except Exception:
+                    rate_text = None
+                
+                if not rate_text:
+                    raise Exception("Rate element not found")
+                
+                # 환율 파싱 (콤마 제거 + 범위 확인)
+                rate = parse_rate(rate_text)
+                if rate is None:
+                    raise Exception(f"Invalid rate text: {rate_text}")
             
             # 성공 응답
             result = {
                 'status': 'success',
                 'rate': rate,
                 'source': 'investing.com',
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': iso_now(),
                 'request_count': self.request_count
             }
             
@@ -138,10 +240,14 @@ class InvestingCrawler:
             return result
             
         except Exception as e:
+            # 세션/창이 사라졌으면 다음 요청에서 새로 생성
+            if isinstance(e, (InvalidSessionIdException, NoSuchWindowException)):
+                self.restart_driver()
+            
             return {
                 'status': 'error',
                 'message': str(e),
-                'timestamp': datetime.now().isoformat()
+                'timestamp': iso_now()
             }
     
     def cleanup(self):
@@ -160,13 +266,14 @@ def main():
         # 단일 요청 모드
         if len(sys.argv) > 1 and sys.argv[1] == '--single':
             result = crawler.fetch_usdkrw()
-            print(json.dumps(result))
+            sys.stdout.buffer.write(json_dumps(result) + b'\n')
         
         # 연속 실행 모드 (테스트용)
         else:
             while True:
                 result = crawler.fetch_usdkrw()
-                print(json.dumps(result), flush=True)
+                sys.stdout.buffer.write(json_dumps(result) + b'\n')
+                sys.stdout.buffer.flush()
                 
                 # 다음 요청까지 랜덤 대기
                 interval = crawler.anti_detect.random_request_interval()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+FX 크롤러 공용 유틸리티
+"""
+import fcntl
+import json
+import mmap
+import os
+import queue
+import re
+import signal
+import struct
+import threading
+import time
+
+# orjson (선택) - 없으면 표준 json 사용
+try:
+    import orjson
+    
+    def json_dumps(obj):
+        """객체를 JSON bytes로 직렬화"""
+        return orjson.dumps(obj)
+    
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj):
+        """객체를 JSON bytes로 직렬화 (orjson과 같은 공백 없는 형식)"""
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    
+    json_loads = json.loads
+
+# 합리적 환율 범위 (KRW/USD)
+RATE_MIN = 1000
+RATE_MAX = 2000
+
+# investing.com 차트 API (USD/KRW = pid 650, 최근 1분봉)
+INVESTING_CHART_API_URL = 'https://api.investing.com/api/financialdata/650/historical/chart?interval=PT1M&pointscount=1'
+INVESTING_API_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Referer': 'https://www.investing.com/',
+    'Connection': 'keep-alive'
+}
+
+# investing.com HTML 페이지 요청 헤더 (HTTP 크롤러 공용)
+HTML_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+# investing.com HTML 환율 패턴 (모듈 로드시 한 번만 컴파일, 바이트 단위 매칭)
+RATE_PATTERNS = [re.compile(p) for p in (
+    rb'"last":([0-9,]+\.?[0-9]*)',
+    rb'data-test="instrument-price-last"[^>]*>([0-9,]+\.?[0-9]*)<',
+    rb'data-value="([0-9,]+\.?[0-9]*)"',
+    rb'class="[^"]*instrument-price[^"]*"[^>]*>([0-9,]+\.?[0-9]*)<',
+    rb'>([0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]+)?)</span>'
+)]
+
+# 페이지 로드시 차단할 리소스 (환율은 HTML/JS에만 있음)
+BLOCKED_RESOURCE_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.mp4', '*.webm',
+    '*googletagmanager*', '*google-analytics*', '*doubleclick*', '*googlesyndication*'
+]
+
+# 이미지 로딩 비활성화 Chrome prefs (CDP 차단의 보조 수단)
+NO_IMAGES_PREFS = {'profile.managed_default_content_settings.images': 2}
+
+# 재시작 후 재접속할 WebDriver 세션 정보 (chromedriver 주소 + session id + PID)
+FX_SESSION_FILE = "/tmp/fx_chrome_session.id"
+
+# 환율 공유 메모리 (소비자는 mmap 후 시스템 콜 없이 읽기)
+FX_SHM_PATH = "/dev/shm/usdkrw_rate"
+FX_SHM_SIZE = 64
+
+# 레이아웃: [0..8) seq(u64) | [8..28) rate(f64), timestamp_unix(f64), source_id(u32)
+_SEQ = struct.Struct('<Q')
+_PAYLOAD = struct.Struct('<ddI')
+
+SOURCE_IDS = {
+    "unknown": 0,
+    "investing.com": 1,
+    "investing.com (selenium)": 2,
+    "exchangerate-api": 3,
+    "fixer.io (demo)": 4
+}
+SOURCE_NAMES = {v: k for k, v in SOURCE_IDS.items()}
+
+_ts_cache = (0, '')
+
+def iso_from(ts):
+    """unix 시각 -> ISO 문자열 (초 단위, 같은 초 안에서는 캐시 재사용)
+    
+    환율 파일의 timestamp 형식은 모든 writer가 이 함수로 통일
+    """
+    global _ts_cache
+    t = int(ts)
+    if t != _ts_cache[0]:
+        _ts_cache = (t, time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t)))
+    return _ts_cache[1]
+
+def iso_now():
+    """현재 시각 ISO 문자열 (초 단위)"""
+    return iso_from(time.time())
+
+def parse_rate(text):
+    """환율 문자열(str/bytes) 파싱 + 범위 확인, 실패시 None"""
+    # 쉼표가 없으면 replace(새 문자열 할당) 생략 - float()가 앞뒤 공백은 처리
+    if isinstance(text, str):
+        if ',' in text:
+            text = text.replace(',', '')
+    elif b',' in text:
+        text = text.replace(b',', b'')
+    
+    try:
+        rate = float(text)
+    except ValueError:
+        return None
+    
+    return rate if RATE_MIN < rate < RATE_MAX else None
+
+def fetch_investing_chart_rate(session, timeout=3):
+    """investing.com 차트 API에서 최신 종가 조회
+    
+    session은 keep-alive 재사용용 requests.Session, HTTP/파싱 오류는 예외로 전달
+    """
+    response = session.get(INVESTING_CHART_API_URL, timeout=timeout)
+    response.raise_for_status()
+    # data: [[timestamp, open, high, low, close, ...], ...]
+    return parse_rate(str(json_loads(response.content)['data'][-1][4]))
+
+def block_heavy_resources(driver):
+    """이미지/폰트/미디어/광고 요청을 CDP로 차단"""
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_RESOURCE_URLS})
+    driver.execute_cdp_cmd('Network.enable', {})
+
+def driver_service_pid(driver):
+    """드라이버의 chromedriver 프로세스 PID (알 수 없으면 None)"""
+    pid = getattr(driver, 'service_pid', None)
+    if pid:
+        return pid
+    try:
+        return driver.service.process.pid
+    except AttributeError:
+        return None
+
+def terminate_chromedriver(pid):
+    """재접속한 세션의 chromedriver 종료 (PID 재사용 대비 cmdline 확인)"""
+    if not pid:
+        return
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            if b'chromedriver' not in f.read():
+                return
+        os.kill(pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+def save_driver_sessions(drivers, path=FX_SESSION_FILE):
+    """살아있는 WebDriver 세션 목록 저장 (프로세스 재시작시 재접속용)"""
+    sessions = [
+        {
+            "url": driver.command_executor._url,
+            "session_id": driver.session_id,
+            "service_pid": driver_service_pid(driver)
+        }
+        for driver in drivers
+    ]
+    write_rate_file(path, sessions)
+
+def attach_driver(url, session_id, service_pid=None):
+    """기존 chromedriver 세션에 새 브라우저 없이 재접속 (keep-alive 연결)
+    
+    이전 프로세스의 chromedriver는 quit()에서 함께 종료
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.remote_connection import ChromeRemoteConnection
+    
+    class AttachedChrome(webdriver.Remote):
+        def start_session(self, capabilities, *args, **kwargs):
+            # 새 세션을 만들지 않고 저장된 session id 사용
+            self.session_id = session_id
+            self.caps = {}
+        
+        def execute_cdp_cmd(self, cmd, cmd_args):
+            return self.execute('executeCdpCommand', {'cmd': cmd, 'params': cmd_args})['value']
+        
+        def quit(self):
+            try:
+                super().quit()
+            finally:
+                terminate_chromedriver(self.service_pid)
+    
+    connection = ChromeRemoteConnection(remote_server_addr=url, keep_alive=True)
+    driver = AttachedChrome(command_executor=connection, options=webdriver.ChromeOptions())
+    driver.service_pid = service_pid
+    return driver
+
+def attach_driver_sessions(path=FX_SESSION_FILE):
+    """저장된 세션에 재접속, 응답하는 드라이버 목록 반환"""
+    try:
+        with open(path, 'rb') as f:
+            sessions = json_loads(f.read())
+    except (OSError, ValueError):
+        return []
+    
+    drivers = []
+    for session in sessions:
+        service_pid = session.get("service_pid")
+        try:
+            driver = attach_driver(session["url"], session["session_id"], service_pid)
+            driver.current_url  # 세션 생존 확인
+            drivers.append(driver)
+        except Exception:
+            # 브라우저 없이 남은 chromedriver 정리
+            terminate_chromedriver(service_pid)
+            continue
+    
+    return drivers
+
+def write_rate_file(path, data, sync=False):
+    """환율 데이터를 파일에 원자적으로 저장
+    
+    버퍼드 open() 대신 fd를 직접 사용해 open/write/close/rename 만 호출
+    sync=True면 rename 전에 fdatasync
+    """
+    payload = json_dumps(data)
+    tmp_file = f"{path}.tmp"
+    
+    try:
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, payload)
+            if sync:
+                os.fdatasync(fd)
+        finally:
+            os.close(fd)
+        
+        # 원자적으로 이동
+        os.rename(tmp_file, path)
+    
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+class RateShm:
+    """환율 공유 메모리 슬롯 (Seqlock, 다중 writer / 다중 reader)
+    
+    Writer: flock 획득, seq+1 (홀수=쓰기중), payload, seq+1 (짝수=완료)
+    Reader: seq1 읽기(짝수 확인), payload, seq2 읽기(seq1==seq2 확인)
+    """
+    def __init__(self, path=FX_SHM_PATH, writer=False):
+        flags = os.O_RDWR | os.O_CREAT if writer else os.O_RDONLY
+        fd = os.open(path, flags, 0o644)
+        try:
+            if writer:
+                os.ftruncate(fd, FX_SHM_SIZE)
+            access = mmap.ACCESS_WRITE if writer else mmap.ACCESS_READ
+            self._mm = mmap.mmap(fd, FX_SHM_SIZE, access=access)
+        except Exception:
+            os.close(fd)
+            raise
+        
+        # 여러 프로세스가 같은 슬롯에 쓰므로 writer는 flock용 fd 유지
+        if writer:
+            self._fd = fd
+            self._lock = threading.Lock()
+        else:
+            self._fd = None
+            os.close(fd)
+    
+    def write(self, rate, timestamp_unix, source):
+        """환율 기록 (pack_into는 순서대로 저장하므로 x86 TSO에서 seq 순서 보장)"""
+        mm = self._mm
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                # seq는 매번 매핑에서 읽음 (다른 writer의 기록 반영)
+                seq = _SEQ.unpack_from(mm, 0)[0]
+                # 이전 writer가 쓰는 도중 종료했으면 짝수로 맞춤
+                seq += seq & 1
+                _SEQ.pack_into(mm, 0, seq + 1)
+                _PAYLOAD.pack_into(mm, _SEQ.size, rate, timestamp_unix, SOURCE_IDS.get(source, 0))
+                _SEQ.pack_into(mm, 0, seq + 2)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+    
+    def read(self, max_retries=100):
+        """(rate, timestamp_unix, source) 반환, 기록된 적 없으면 None"""
+        mm = self._mm
+        for _ in range(max_retries):
+            seq1 = _SEQ.unpack_from(mm, 0)[0]
+            if seq1 & 1:
+                continue
+            rate, timestamp_unix, source_id = _PAYLOAD.unpack_from(mm, _SEQ.size)
+            if _SEQ.unpack_from(mm, 0)[0] == seq1:
+                if seq1 == 0:
+                    return None
+                return rate, timestamp_unix, SOURCE_NAMES.get(source_id, "unknown")
+        return None
+    
+    def close(self):
+        self._mm.close()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class RateFileWriter:
+    """환율 파일 백그라운드 writer (최신 값만 유지)
+    
+    fetch 경로는 큐에 넣고 바로 반환, 디스크 I/O는 데몬 스레드에서 처리
+    """
+    def __init__(self, path, logger):
+        self.path = path
+        self.logger = logger
+        self._queue = queue.Queue(maxsize=1)
+        
+        threading.Thread(target=self._writer_loop, daemon=True).start()
+    
+    def submit(self, data):
+        """쓰기 요청 (아직 쓰지 못한 이전 값은 버림)"""
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(data)
+    
+    def _writer_loop(self):
+        while True:
+            data = self._queue.get()
+            try:
+                write_rate_file(self.path, data, sync=True)
+                self.logger.info(f"Saved rate: {data['rate']} from {data['source']}")
+            except Exception as e:
+                self.logger.error(f"Failed to save rate: {e}")
+
+
+class RatePublisher:
+    """크롤러 공용 환율 게시 (공유 메모리 즉시 기록 + JSON 파일 백그라운드 저장)"""
+    def __init__(self, path, logger):
+        self.logger = logger
+        self._shm = RateShm(writer=True)
+        self._writer = RateFileWriter(path, logger)
+    
+    def publish(self, rate, source, now=None):
+        """환율 게시, 기록한 데이터 dict 반환"""
+        if now is None:
+            now = time.time()
+        data = {
+            "rate": rate,
+            "source": source,
+            "timestamp": iso_from(now),
+            "timestamp_unix": now
+        }
+        
+        try:
+            self._shm.write(rate, now, source)
+        except Exception as e:
+            self.logger.error(f"Failed to publish rate: {e}")
+        
+        # 파일 쓰기는 백그라운드 스레드에서 (fetch 경로/이벤트 루프 블로킹 방지)
+        self._writer.submit(data)
+        return data
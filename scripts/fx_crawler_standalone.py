@@ -2,24 +2,99 @@
 """
 독립 실행형 환율 크롤러 - 파일로 결과 저장
 """
-import json
 import time
 import logging
-import os
-from datetime import datetime
 from pathlib import Path
 import fcntl
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+from fx_common import (
+    HTML_HEADERS, RATE_MAX, RATE_MIN, RATE_PATTERNS, RatePublisher, json_loads, parse_rate
+)
+
+# Selenium 경로 (선택) - 빠른 경로와 경쟁시키는 hedged request용
+try:
+    from crawl_investing import InvestingCrawler
+    SELENIUM_AVAILABLE = True
+except Exception:
+    SELENIUM_AVAILABLE = False
+
+# Hyperscan (선택) - 설치되어 있으면 모든 패턴을 한 번에 스캔
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
 
 # 환율 데이터 파일 경로
 FX_DATA_FILE = "/tmp/usdkrw_rate.json"
 FX_LOCK_FILE = "/tmp/usdkrw_rate.lock"
 
+# 백업 API 목록
+API_SOURCES = [
+    {
+        "name": "exchangerate-api",
+        "url": "https://api.exchangerate-api.com/v4/latest/USD",
+        "parser": lambda data: data.get('rates', {}).get('KRW')
+    },
+    {
+        "name": "fixer.io (demo)",
+        "url": "http://data.fixer.io/api/latest?access_key=demo&symbols=KRW&base=USD",
+        "parser": lambda data: data.get('rates', {}).get('KRW')
+    }
+]
+
+# Hedged request 설정
+HEDGE_DELAY = 2     # 빠른 경로가 이 시간 안에 성공하지 못하면 Selenium 동시 실행
+HEDGE_TIMEOUT = 10  # 전체 대기 한도
+
+# 스트리밍 수신 설정
+STREAM_CHUNK_SIZE = 16384
+STREAM_OVERLAP = 1024  # 청크 경계 재탐색 구간
+
+def _compile_hyperscan_db():
+    """RATE_PATTERNS를 하나의 Hyperscan DB로 컴파일 (캡처 그룹은 re로 재추출)"""
+    db = hyperscan.Database()
+    db.compile(
+        expressions=[p.pattern for p in RATE_PATTERNS],
+        ids=list(range(len(RATE_PATTERNS))),
+        elements=len(RATE_PATTERNS),
+        flags=[hyperscan.HS_FLAG_SOM_LEFTMOST] * len(RATE_PATTERNS)
+    )
+    return db
+
+_HS_DB = _compile_hyperscan_db() if hyperscan else None
+
 class StandaloneFXCrawler:
     def __init__(self):
         self.logger = logging.getLogger('FXCrawler')
         self.setup_logging()
         
+        # 패턴 시도 순서 (성공한 패턴을 맨 앞으로 이동)
+        self._pattern_order = list(range(len(RATE_PATTERNS)))
+        
+        # __NEXT_DATA__ 안의 환율 키 경로 (첫 성공 후 캐시)
+        self._next_data_path = None
+        
+        # TCP+TLS 연결 재사용 (investing.com + 백업 API 공용)
+        self._session = requests.Session()
+        self._session.headers.update(HTML_HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        
+        # 환율 공유 메모리 (JSON 파일은 C++ fxrate 호환용으로 유지)
+        self._publisher = RatePublisher(FX_DATA_FILE, self.logger)
+        
+        # 백업 API 동시 요청용 스레드 풀
+        self._api_executor = ThreadPoolExecutor(max_workers=len(API_SOURCES))
+        
+        # 빠른 경로 / Selenium 경로 경쟁용 (Selenium은 한 번에 하나만 실행)
+        self._hedge_executor = ThreadPoolExecutor(max_workers=2)
+        self._selenium = InvestingCrawler(headless=True) if SELENIUM_AVAILABLE else None
+        self._selenium_future = None
+        
     def setup_logging(self):
         """로깅 설정"""
         log_dir = Path.home() / "kimchi-arbitrage-cpp" / "logs"
@@ -32,105 +107,220 @@ class StandaloneFXCrawler:
         self.logger.addHandler(handler)
         self.logger.setLevel(logging.INFO)
         
+    def search_rate(self, pattern, body, pos=0):
+        """body[pos:]에서 패턴을 찾아 유효 환율 반환, 없거나 범위 밖이면 None"""
+        match = pattern.search(body, pos)
+        if not match:
+            return None
+        
+        return parse_rate(match.group(1))
+    
+    def find_match_offsets(self, body):
+        """Hyperscan 단일 패스로 패턴별 가장 앞선 매치 시작 위치 수집"""
+        offsets = {}
+        
+        def on_match(idx, start, end, flags, context):
+            if start < offsets.get(idx, start + 1):
+                offsets[idx] = start
+        
+        _HS_DB.scan(bytes(body), match_event_handler=on_match)
+        return offsets
+    
+    def find_next_data_path(self, data, path=()):
+        """__NEXT_DATA__ JSON에서 유효한 'last' 값의 키 경로 탐색"""
+        if isinstance(data, dict):
+            items = data.items()
+        elif isinstance(data, list):
+            items = enumerate(data)
+        else:
+            return None
+        
+        for key, value in items:
+            if key == 'last' and parse_rate(str(value)):
+                return path + (key,)
+            found = self.find_next_data_path(value, path + (key,))
+            if found:
+                return found
+        return None
+    
+    def extract_next_data(self, body):
+        """<script id="__NEXT_DATA__"> JSON에서 환율 추출"""
+        idx = body.find(b'__NEXT_DATA__')
+        if idx < 0:
+            return None
+        start = body.find(b'>', idx) + 1
+        end = body.find(b'</script>', start)
+        if start == 0 or end < 0:
+            return None
+        
+        data = json_loads(bytes(body[start:end]))
+        
+        # 캐시된 키 경로 먼저 시도
+        if self._next_data_path:
+            try:
+                value = data
+                for key in self._next_data_path:
+                    value = value[key]
+                rate = parse_rate(str(value))
+                if rate:
+                    return rate
+            except (KeyError, IndexError, TypeError):
+                pass
+        
+        # 페이지 구조가 바뀌었으면 다시 탐색
+        self._next_data_path = self.find_next_data_path(data)
+        if not self._next_data_path:
+            return None
+        
+        value = data
+        for key in self._next_data_path:
+            value = value[key]
+        return parse_rate(str(value))
+    
     def fetch_from_investing(self):
         """investing.com에서 실시간 환율 크롤링 - 정규식만 사용"""
         try:
-            import requests
-            import re
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1'
-            }
+            response = self._session.get('https://www.investing.com/currencies/usd-krw', 
+                                         timeout=10, stream=True)
             
-            response = requests.get('https://www.investing.com/currencies/usd-krw', 
-                                  headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                # HTML에서 직접 패턴 매칭
-                patterns = [
-                    r'"last":([0-9,]+\.?[0-9]*)',
-                    r'data-test="instrument-price-last"[^>]*>([0-9,]+\.?[0-9]*)<',
-                    r'data-value="([0-9,]+\.?[0-9]*)"',
-                    r'class="[^"]*instrument-price[^"]*"[^>]*>([0-9,]+\.?[0-9]*)<',
-                    r'>([0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]+)?)</span>'
-                ]
+            with response:
+                if response.status_code != 200:
+                    return None, None
                 
-                for pattern in patterns:
-                    match = re.search(pattern, response.text)
+                # 스트리밍 수신 중 가장 최근 성공 패턴으로 조기 매칭
+                body = bytearray()
+                front = RATE_PATTERNS[self._pattern_order[0]]
+                scan_from = 0
+                
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    body.extend(chunk)
+                    if front is None:
+                        continue
+                    
+                    match = front.search(body, scan_from)
+                    if match and match.end() == len(body):
+                        # 숫자가 버퍼 끝에서 잘렸을 수 있으므로 다음 청크까지 대기
+                        scan_from = match.start()
+                        continue
                     if match:
-                        rate_text = match.group(1).replace(',', '')
-                        try:
-                            rate = float(rate_text)
-                            if 1000 < rate < 2000:  # 합리적 범위
-                                self.logger.info(f"Got rate from investing.com: {rate}")
-                                return rate, "investing.com"
-                        except:
-                            continue
+                        rate = parse_rate(match.group(1))
+                        if rate:
+                            # 나머지 본문은 받지 않고 연결 종료
+                            self.logger.info(f"Got rate from investing.com: {rate}")
+                            return rate, "investing.com"
+                        # 첫 매치가 범위 밖이면 전체 본문으로 판단
+                        front = None
+                    else:
+                        # 청크 경계에 걸친 매치를 위해 겹쳐서 재탐색
+                        scan_from = max(0, len(body) - STREAM_OVERLAP)
+            
+            # 사이트 전용 빠른 경로: __NEXT_DATA__ JSON
+            try:
+                rate = self.extract_next_data(body)
+                if rate:
+                    self.logger.info(f"Got rate from investing.com (__NEXT_DATA__): {rate}")
+                    return rate, "investing.com"
+            except ValueError as e:
+                self.logger.debug(f"Failed to parse __NEXT_DATA__: {e}")
+            
+            # HTML 전체에서 패턴 매칭 (Hyperscan이 있으면 매치 위치부터만 재탐색)
+            offsets = self.find_match_offsets(body) if _HS_DB else None
+            
+            for pos, idx in enumerate(self._pattern_order):
+                if offsets is None:
+                    rate = self.search_rate(RATE_PATTERNS[idx], body)
+                elif idx in offsets:
+                    rate = self.search_rate(RATE_PATTERNS[idx], body, offsets[idx])
+                else:
+                    continue
+                if rate:
+                    # move-to-front: 다음 호출에서 먼저 시도
+                    if pos:
+                        del self._pattern_order[pos]
+                        self._pattern_order.insert(0, idx)
+                    self.logger.info(f"Got rate from investing.com: {rate}")
+                    return rate, "investing.com"
                             
         except Exception as e:
             self.logger.warning(f"Failed to fetch from investing.com: {e}")
             
         return None, None
     
-    def fetch_from_api(self):
-        """API에서 환율 가져오기 (백업)"""
-        sources = [
-            {
-                "name": "exchangerate-api",
-                "url": "https://api.exchangerate-api.com/v4/latest/USD",
-                "parser": lambda data: data.get('rates', {}).get('KRW')
-            },
-            {
-                "name": "fixer.io (demo)",
-                "url": "http://data.fixer.io/api/latest?access_key=demo&symbols=KRW&base=USD",
-                "parser": lambda data: data.get('rates', {}).get('KRW')
-            }
-        ]
-        
-        import requests
-        for source in sources:
-            try:
-                response = requests.get(source['url'], timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
-                    rate = source['parser'](data)
-                    if rate:
-                        return rate, source['name']
-            except Exception as e:
-                self.logger.warning(f"Failed to fetch from {source['name']}: {e}")
-                
-        return None, None
+    def fetch_from_selenium(self):
+        """Selenium으로 investing.com 크롤링 (느리지만 안정적)"""
+        result = self._selenium.fetch_usdkrw()
         
-    def write_rate_data(self, rate, source):
-        """환율 데이터를 파일에 저장 (원자적 쓰기)"""
-        data = {
-            "rate": rate,
-            "source": source,
-            "timestamp": datetime.now().isoformat(),
-            "timestamp_unix": time.time()
-        }
-        
-        # 임시 파일에 먼저 쓰기
-        tmp_file = f"{FX_DATA_FILE}.tmp"
-        try:
-            with open(tmp_file, 'w') as f:
-                json.dump(data, f)
+        if result.get('status') == 'success':
+            rate = result['rate']
+            if RATE_MIN < rate < RATE_MAX:
+                self.logger.info(f"Got rate from investing.com (selenium): {rate}")
+                return rate, "investing.com (selenium)"
+        else:
+            self.logger.warning(f"Failed to fetch with selenium: {result.get('message')}")
             
-            # 원자적으로 이동
-            os.rename(tmp_file, FX_DATA_FILE)
+        return None, None
+    
+    def fetch_hedged(self):
+        """빠른 경로를 먼저 실행하고, 늦거나 실패하면 Selenium 경로와 경쟁"""
+        futures = [self._hedge_executor.submit(self.fetch_from_investing)]
+        hedged = self._selenium is None
+        deadline = time.monotonic() + HEDGE_TIMEOUT
+        
+        while futures:
+            timeout = HEDGE_DELAY if not hedged else max(0, deadline - time.monotonic())
+            done, pending = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
             
-            self.logger.info(f"Saved rate: {rate} from {source}")
+            for future in done:
+                rate, source = future.result()
+                if rate:
+                    for other in pending:
+                        other.cancel()
+                    return rate, source
             
+            futures = list(pending)
+            if not hedged:
+                # 이전 Selenium 요청이 아직 실행 중이면 그 결과를 기다림
+                hedged = True
+                if self._selenium_future is None or self._selenium_future.done():
+                    self._selenium_future = self._hedge_executor.submit(self.fetch_from_selenium)
+                futures.append(self._selenium_future)
+            elif not done:
+                break
+                
+        return None, None
+    
+    def fetch_api_source(self, source):
+        """백업 API 하나에서 환율 가져오기"""
+        try:
+            response = self._session.get(source['url'], timeout=5)
+            if response.status_code == 200:
+                return source['parser'](json_loads(response.content))
         except Exception as e:
-            self.logger.error(f"Failed to save rate: {e}")
-            if os.path.exists(tmp_file):
-                os.remove(tmp_file)
+            self.logger.warning(f"Failed to fetch from {source['name']}: {e}")
+        return None
+    
+    def fetch_from_api(self):
+        """API에서 환율 가져오기 (백업) - 모든 소스 동시 요청, 먼저 성공한 값 사용"""
+        futures = {
+            self._api_executor.submit(self.fetch_api_source, source): source
+            for source in API_SOURCES
+        }
+        
+        try:
+            for future in as_completed(futures):
+                rate = future.result()
+                if rate:
+                    return rate, futures[future]['name']
+        finally:
+            # 남은 요청 취소 (이미 실행 중인 요청은 타임아웃으로 종료)
+            for future in futures:
+                future.cancel()
+                
+        return None, None
+        
+    def write_rate_data(self, rate, source):
+        """환율 데이터 게시 (공유 메모리 + 파일)"""
+        self._publisher.publish(rate, source)
                 
     def run(self):
         """메인 루프"""
@@ -138,8 +328,8 @@ class StandaloneFXCrawler:
         
         while True:
             try:
-                # 먼저 investing.com 시도
-                rate, source = self.fetch_from_investing()
+                # 먼저 investing.com 시도 (requests / Selenium 경쟁)
+                rate, source = self.fetch_hedged()
                 
                 # investing.com 실패시 API 백업
                 if not rate:
@@ -160,6 +350,9 @@ class StandaloneFXCrawler:
             except Exception as e:
                 self.logger.error(f"Unexpected error: {e}")
                 time.sleep(10)
+        
+        if self._selenium:
+            self._selenium.cleanup()
 
 if __name__ == "__main__":
     # 데몬으로 실행하려면:
@@ -2,49 +2,121 @@
 """
 FX Rate Service - 별도 프로세스로 실행되는 환율 크롤링 서비스
 """
-import json
+import asyncio
 import socket
 import threading
 import time
 import logging
-from datetime import datetime
-from dataclasses import dataclass
-from typing import Optional
+import random
+from typing import NamedTuple, Optional
 import signal
 import sys
 import os
 
+import requests
+
+from fx_common import (
+    FX_SESSION_FILE, INVESTING_API_HEADERS, attach_driver_sessions, fetch_investing_chart_rate,
+    iso_from, json_dumps, json_loads, parse_rate, save_driver_sessions
+)
+
 # Selenium 관련 임포트는 나중에
 try:
     from selenium import webdriver
     from selenium.webdriver.common.by import By
     from selenium.webdriver.support.ui import WebDriverWait
     from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import (
+        InvalidSessionIdException, NoSuchWindowException, TimeoutException
+    )
     import undetected_chromedriver as uc
     SELENIUM_AVAILABLE = True
 except ImportError:
     SELENIUM_AVAILABLE = False
 
-@dataclass
-class FXRate:
+class FXRate(NamedTuple):
+    """캐시된 환율 (불변 - 통째로 교체)"""
     rate: float
     timestamp: str
+    timestamp_unix: float
     source: str
-    error: Optional[str] = None
+    response: bytes  # 미리 직렬화한 GET_RATE 응답
+
+# 환율 요소 (data-test 속성 / 클래스명 / pid 클래스 중 먼저 나타나는 것)
+RATE_ELEMENT_XPATH = (
+    '//*[@data-test="instrument-price-last"]'
+    ' | //*[contains(@class, "instrument-price_last")]'
+    ' | //*[contains(@class, "pid-650-last")]'
+)
+
+# 캐시가 없을 때 응답 (한 번만 직렬화)
+NO_RATE_RESPONSE = json_dumps({"status": "error", "message": "No rate available"})
+
+class ThreadCounters:
+    """스레드별 카운터 (각 스레드는 자기 dict만 증가, 읽을 때 합산)"""
+    def __init__(self, *names):
+        self.names = names
+        self._local = threading.local()
+        self._all = []  # 모든 스레드의 dict (스레드 종료 후에도 합계 유지)
+        self._lock = threading.Lock()  # 스레드 첫 등록시에만 사용
+    
+    def incr(self, name):
+        counts = getattr(self._local, 'counts', None)
+        if counts is None:
+            counts = self._local.counts = dict.fromkeys(self.names, 0)
+            with self._lock:
+                self._all.append(counts)
+        counts[name] += 1
+    
+    def totals(self):
+        with self._lock:
+            all_counts = list(self._all)
+        return {name: sum(counts[name] for counts in all_counts) for name in self.names}
+
+# 자동 갱신 간격 (성공시 줄이고 실패시 지수적으로 늘림)
+UPDATE_DELAY_MIN = 8
+UPDATE_DELAY_MAX = 300
+
+class UpdaterState:
+    """업데이트 스레드가 수정하는 상태 (읽기측 snapshot과 별도 객체로 분리)"""
+    __slots__ = ('next_delay', 'counters')
+    
+    def __init__(self):
+        self.next_delay = 10  # 다음 자동 갱신까지 대기 시간
+        self.counters = ThreadCounters("requests", "success", "errors")
+
+# 구독자 송신 버퍼 한도 (읽지 않는 클라이언트는 끊음)
+SUBSCRIBER_BUFFER_LIMIT = 64 * 1024
 
 class FXRateService:
-    def __init__(self, port=9516):
+    def __init__(self, port=9516, reuse_port=False):
         self.port = port
+        self.reuse_port = reuse_port
         self.running = False
-        self.server_socket = None
+        self.loop = None
+        self.shutdown_event = None  # 이벤트 루프에서 생성
         self.driver = None
         
-        # 캐시
-        self.cached_rate = None
-        self.cache_lock = threading.Lock()
-        self.last_update = 0
+        # 단일 인스턴스는 재시작시 재접속용 공용 세션 파일 사용
+        # reuse_port로 여러 인스턴스가 뜨면 서로의 브라우저를 건드리지 않도록 PID별 파일
+        if reuse_port:
+            self.session_file = f"{FX_SESSION_FILE}.{os.getpid()}"
+        else:
+            self.session_file = FX_SESSION_FILE
+        
+        # investing.com API / fallback API용 HTTP 세션 (호스트별 TCP+TLS 재사용)
+        self.session = requests.Session()
+        self.session.headers.update(INVESTING_API_HEADERS)
+        
+        # 캐시 - 읽기는 락 없이 참조만 복사, 쓰기는 새 튜플로 교체 (CPython에서 원자적)
+        # 갱신은 자동 업데이트 스레드만 수행, 요청측은 만료시 refresh_event로 알림
+        self.snapshot = None
+        self.refresh_event = threading.Event()
         self.update_interval = 10  # 10초
         
+        # SUBSCRIBE 클라이언트 (이벤트 루프에서만 접근)
+        self.subscribers = set()
+        
         # 로깅 설정
         logging.basicConfig(
             level=logging.INFO,
@@ -52,15 +124,20 @@ class FXRateService:
         )
         self.logger = logging.getLogger('FXService')
         
-        # 크롤링 통계
-        self.request_count = 0
-        self.success_count = 0
-        self.error_count = 0
+        # 갱신 간격 + 크롤링 통계
+        self.updater = UpdaterState()
         
     def setup_driver(self):
         """Chrome 드라이버 설정"""
         if not SELENIUM_AVAILABLE:
             return None
+        
+        # 이전 프로세스가 남긴 브라우저 세션이 살아있으면 재접속
+        drivers = attach_driver_sessions(self.session_file)
+        if drivers:
+            self.driver = drivers[0]
+            self.logger.info("Reattached to existing Chrome session")
+            return True
             
         options = uc.ChromeOptions()
         options.add_argument('--headless')
@@ -70,41 +147,64 @@ class FXRateService:
         options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
         
         try:
-            self.driver = uc.Chrome(options=options)
+            # chromedriver와의 HTTP 연결 재사용
+            self.driver = uc.Chrome(options=options, keep_alive=True)
+            save_driver_sessions([self.driver], self.session_file)
             self.logger.info("Chrome driver initialized")
             return True
         except Exception as e:
             self.logger.error(f"Failed to init Chrome: {e}")
             return False
     
-    def crawl_investing(self) -> Optional[float]:
-        """investing.com에서 환율 크롤링"""
+    def close_driver(self):
+        """드라이버 종료 + 저장된 세션 정보 삭제"""
         if not self.driver:
+            return
+        
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        self.driver = None
+        save_driver_sessions([], self.session_file)
+    
+    def crawl_investing(self) -> Optional[float]:
+        """investing.com에서 환율 조회 (HTTP API 우선, 실패시 Selenium)"""
+        try:
+            rate = fetch_investing_chart_rate(self.session)
+            if rate:
+                return rate
+        except (requests.RequestException, KeyError, IndexError, TypeError, ValueError) as e:
+            self.logger.warning(f"Investing API error: {e}")
+        
+        return self.crawl_investing_selenium()
+    
+    def crawl_investing_selenium(self) -> Optional[float]:
+        """Selenium으로 investing.com 페이지 크롤링 (드라이버는 필요할 때 생성)"""
+        if not SELENIUM_AVAILABLE:
+            return None
+        if not self.driver and not self.setup_driver():
             return None
             
         try:
             self.driver.get('https://www.investing.com/currencies/usd-krw')
             
-            # 여러 선택자 시도
-            selectors = [
-                '[data-test="instrument-price-last"]',
-                '.instrument-price_last__KQzyA',
-                '.pid-650-last'
-            ]
-            
+            # 여러 선택자를 XPath 합집합으로 한 번에 대기 (하나라도 있으면 바로 반환)
             rate_element = None
-            for selector in selectors:
-                try:
-                    rate_element = WebDriverWait(self.driver, 5).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                    )
-                    break
-                except:
-                    continue
+            try:
+                rate_element = WebDriverWait(self.driver, 5).until(
+                    EC.presence_of_element_located((By.XPATH, RATE_ELEMENT_XPATH))
+                )
+            except TimeoutException:
+                pass
                     
             if rate_element:
-                rate_text = rate_element.text.replace(',', '')
-                return float(rate_text)
+                return parse_rate(rate_element.text)
+        
+        except (InvalidSessionIdException, NoSuchWindowException) as e:
+            # 비정상 세션만 종료 (다음 요청에서 새로 생성)
+            self.logger.error(f"Driver session lost: {e}")
+            self.close_driver()
                 
         except Exception as e:
             self.logger.error(f"Crawling error: {e}")
@@ -112,29 +212,24 @@ class FXRateService:
         return None
     
     def fetch_fallback(self) -> Optional[float]:
-        """Fallback API 사용"""
+        """Fallback API 사용 (investing.com과 같은 세션 - 연결 재사용)"""
         try:
-            import requests
-            response = requests.get(
+            response = self.session.get(
                 'https://api.exchangerate-api.com/v4/latest/USD',
                 timeout=5
             )
-            data = response.json()
+            data = json_loads(response.content)
             return data.get('rates', {}).get('KRW')
         except:
             return None
     
-    def update_rate(self):
-        """환율 업데이트 (자동 갱신용)"""
-        self.request_count += 1
-        
-        # Selenium 크롤링 시도
-        rate = None
-        source = "unknown"
+    def update_rate(self) -> bool:
+        """환율 업데이트 (자동 갱신용), 성공 여부 반환"""
+        self.updater.counters.incr("requests")
         
-        if SELENIUM_AVAILABLE and self.driver:
-            rate = self.crawl_investing()
-            source = "investing.com"
+        # investing.com 시도 (API → Selenium)
+        rate = self.crawl_investing()
+        source = "investing.com"
         
         # Fallback
         if not rate:
@@ -142,83 +237,161 @@ class FXRateService:
             source = "exchangerate-api"
         
         if rate:
-            self.success_count += 1
-            with self.cache_lock:
-                self.cached_rate = FXRate(
-                    rate=rate,
-                    timestamp=datetime.now().isoformat(),
-                    source=source
-                )
-                self.last_update = time.time()
+            self.updater.counters.incr("success")
+            # 모든 필드와 응답 bytes를 만든 뒤 한 번에 게시 (읽는 쪽은 완성된 값만 봄)
+            # 시각은 한 번만 읽고 ISO 문자열도 여기서 한 번만 생성 (응답/구독은 재사용)
+            now = time.time()
+            timestamp = iso_from(now)
+            self.snapshot = FXRate(
+                rate=rate,
+                timestamp=timestamp,
+                timestamp_unix=now,
+                source=source,
+                response=json_dumps(self.rate_message(rate, source, timestamp))
+            )
+            self.publish(self.snapshot)
             self.logger.info(f"Rate updated: {rate} from {source}")
-        else:
-            self.error_count += 1
-            self.logger.error("Failed to fetch rate from all sources")
+            return True
+        
+        self.updater.counters.incr("errors")
+        self.logger.error("Failed to fetch rate from all sources")
+        return False
+    
+    def publish(self, snapshot):
+        """구독자에게 새 환율 전송 (업데이트 스레드에서 호출 → 이벤트 루프로 전달)"""
+        if self.subscribers and self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.broadcast, snapshot)
     
-    def handle_client(self, client_socket, address):
-        """클라이언트 요청 처리"""
+    def broadcast(self, snapshot):
+        """모든 구독자에게 환율 한 줄 전송 (이벤트 루프에서 실행)"""
+        line = snapshot.response + b"\n"
+        
+        for writer in list(self.subscribers):
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > SUBSCRIBER_BUFFER_LIMIT:
+                self.subscribers.discard(writer)
+                writer.close()
+                continue
+            writer.write(line)
+    
+    def rate_message(self, rate, source, timestamp):
+        """환율 응답 메시지"""
+        return {
+            "status": "success",
+            "rate": rate,
+            "source": source,
+            "timestamp": timestamp
+        }
+    
+    def get_rate_response(self):
+        """GET_RATE 응답 bytes (만료된 캐시도 바로 반환하고 갱신은 요청만 함)"""
+        snapshot = self.snapshot
+        if not snapshot:
+            self.refresh_event.set()
+            return NO_RATE_RESPONSE
+        
+        age = time.time() - snapshot.timestamp_unix
+        if age <= self.update_interval:
+            return snapshot.response  # 직렬화 없이 그대로 전송
+        
+        # 캐시 만료 - 갱신 요청 후 마지막 값을 stale 표시와 함께 반환
+        self.refresh_event.set()
+        response = self.rate_message(snapshot.rate, snapshot.source, snapshot.timestamp)
+        response["stale"] = round(age, 1)
+        return json_dumps(response)
+    
+    def handle_command(self, data):
+        """GET_RATE 외 명령 처리 (이벤트 루프에서 바로 실행)"""
+        if data == "STATS":
+            return {
+                "status": "success",
+                "stats": {
+                    **self.updater.counters.totals(),
+                    "subscribers": len(self.subscribers),
+                    "uptime": int(time.time() - self.start_time)
+                }
+            }
+        
+        if data == "SHUTDOWN":
+            self.running = False
+            self.shutdown_event.set()
+            return {"status": "success", "message": "Shutting down"}
+        
+        return {"status": "error", "message": f"Unknown command: {data}"}
+    
+    def cork(self, writer):
+        """TCP_CORK 설정 (Linux 전용, 실패해도 무시)"""
+        if not hasattr(socket, 'TCP_CORK'):
+            return
+        
+        try:
+            writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+        except OSError:
+            pass
+    
+    async def handle_subscriber(self, reader, writer):
+        """SUBSCRIBE - 연결을 유지하고 환율이 갱신될 때마다 JSON 한 줄씩 전송"""
+        # 먼저 등록해야 현재 값 전송 직후의 갱신을 놓치지 않음
+        self.subscribers.add(writer)
+        snapshot = self.snapshot
+        if snapshot:
+            writer.write(snapshot.response + b"\n")
+        
+        try:
+            # 클라이언트가 연결을 끊을 때까지 대기
+            while await reader.read(1024):
+                pass
+        except (ConnectionError, asyncio.CancelledError):
+            pass  # 연결 끊김 또는 서비스 종료
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+    
+    async def handle_client(self, reader, writer):
+        """클라이언트 요청 처리 (요청 1개에 응답 1개 후 연결 종료, SUBSCRIBE는 연결 유지)"""
         try:
             # 요청 수신
-            data = client_socket.recv(1024).decode('utf-8').strip()
+            data = (await reader.read(1024)).decode('utf-8').strip()
+            
+            if data == "SUBSCRIBE":
+                await self.handle_subscriber(reader, writer)
+                return
             
             if data == "GET_RATE":
-                # 캐시 확인
-                current_time = time.time()
-                with self.cache_lock:
-                    if (not self.cached_rate or 
-                        current_time - self.last_update > self.update_interval):
-                        # 캐시 만료, 업데이트
-                        self.update_rate()
-                    
-                    if self.cached_rate:
-                        response = {
-                            "status": "success",
-                            "rate": self.cached_rate.rate,
-                            "source": self.cached_rate.source,
-                            "timestamp": self.cached_rate.timestamp
-                        }
-                    else:
-                        response = {
-                            "status": "error",
-                            "message": "No rate available"
-                        }
-                        
-            elif data == "STATS":
-                response = {
-                    "status": "success",
-                    "stats": {
-                        "requests": self.request_count,
-                        "success": self.success_count,
-                        "errors": self.error_count,
-                        "uptime": int(time.time() - self.start_time)
-                    }
-                }
-                
-            elif data == "SHUTDOWN":
-                self.running = False
-                response = {"status": "success", "message": "Shutting down"}
-                
+                response = self.get_rate_response()
             else:
-                response = {"status": "error", "message": f"Unknown command: {data}"}
-            
-            # 응답 전송
-            client_socket.send(json.dumps(response).encode('utf-8'))
+                response = json_dumps(self.handle_command(data))
             
         except Exception as e:
             self.logger.error(f"Client handler error: {e}")
-            error_response = {"status": "error", "message": str(e)}
-            client_socket.send(json.dumps(error_response).encode('utf-8'))
+            response = json_dumps({"status": "error", "message": str(e)})
+        
+        try:
+            # 응답 전송 (cork 상태로 써두고 close시 응답과 FIN을 한 세그먼트로 전송)
+            self.cork(writer)
+            writer.write(response)
+            await writer.drain()
+        except ConnectionError as e:
+            self.logger.warning(f"Client disconnected: {e}")
         finally:
-            client_socket.close()
+            writer.close()
     
     def auto_update_thread(self):
         """자동 업데이트 스레드"""
         while self.running:
             try:
-                self.update_rate()
-                # 8-13초 랜덤 대기
-                import random
-                time.sleep(random.uniform(8, 13))
+                state = self.updater
+                updated = self.update_rate()
+                # 갱신 중 도착한 요청의 갱신 알림은 방금 끝난 갱신으로 처리됨
+                self.refresh_event.clear()
+                if updated:
+                    state.next_delay = max(UPDATE_DELAY_MIN, state.next_delay * 0.8)
+                    # 만료된 캐시를 읽은 요청이 있으면 바로 갱신
+                    self.refresh_event.wait(timeout=state.next_delay + random.uniform(0, 5))
+                else:
+                    # 실패시 백오프 - 이 동안은 갱신 요청도 무시
+                    state.next_delay = min(UPDATE_DELAY_MAX, state.next_delay * 2 + random.random())
+                    self.logger.warning(f"Retrying in {state.next_delay:.1f}s")
+                    time.sleep(state.next_delay)
             except Exception as e:
                 self.logger.error(f"Auto update error: {e}")
                 time.sleep(10)
@@ -228,19 +401,9 @@ class FXRateService:
         self.running = True
         self.start_time = time.time()
         
-        # Chrome 드라이버 초기화
-        if SELENIUM_AVAILABLE:
-            self.setup_driver()
-        else:
-            self.logger.warning("Selenium not available, using fallback APIs only")
-        
-        # TCP 서버 소켓 생성
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind(('localhost', self.port))
-        self.server_socket.listen(5)
-        
-        self.logger.info(f"FX Service listening on port {self.port}")
+        # Chrome 드라이버는 API 실패시에만 생성
+        if not SELENIUM_AVAILABLE:
+            self.logger.warning("Selenium not available, using HTTP APIs only")
         
         # 자동 업데이트 스레드 시작
         update_thread = threading.Thread(target=self.auto_update_thread)
@@ -248,34 +411,47 @@ class FXRateService:
         update_thread.start()
         
         # 클라이언트 요청 처리
-        while self.running:
-            try:
-                self.server_socket.settimeout(1.0)
-                client_socket, address = self.server_socket.accept()
-                
-                # 각 클라이언트를 별도 스레드로 처리
-                client_thread = threading.Thread(
-                    target=self.handle_client,
-                    args=(client_socket, address)
-                )
-                client_thread.daemon = True
-                client_thread.start()
-                
-            except socket.timeout:
-                continue
-            except Exception as e:
-                if self.running:
-                    self.logger.error(f"Server error: {e}")
+        asyncio.run(self.serve())
+    
+    def create_server_socket(self):
+        """논블로킹 리스닝 소켓 생성 (생성시 SOCK_NONBLOCK 지정 - 별도 fcntl 불필요)"""
+        sock = socket.socket(
+            socket.AF_INET,
+            socket.SOCK_STREAM | socket.SOCK_NONBLOCK | socket.SOCK_CLOEXEC
+        )
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # 여러 인스턴스가 같은 포트의 accept 큐를 공유 (커널이 분배)
+        # 기본값은 꺼둠 - EADDRINUSE가 중복 실행 방지 역할을 함
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('localhost', self.port))
+        return sock
+    
+    async def serve(self):
+        """단일 스레드 이벤트 루프에서 모든 클라이언트 처리 (이벤트가 있을 때만 깨어남)"""
+        self.loop = asyncio.get_running_loop()
+        self.shutdown_event = asyncio.Event()
+        
+        server = await asyncio.start_server(
+            self.handle_client, sock=self.create_server_socket(), backlog=128
+        )
+        self.logger.info(f"FX Service listening on port {self.port}")
+        
+        async with server:
+            await self.shutdown_event.wait()
+            
+            # 구독 연결을 닫아야 서버 종료 대기가 끝남
+            for writer in list(self.subscribers):
+                writer.close()
     
     def stop(self):
-        """서비스 종료"""
+        """서비스 종료 (다른 스레드에서 호출해도 이벤트 루프를 깨움)"""
         self.running = False
         
-        if self.server_socket:
-            self.server_socket.close()
-            
-        if self.driver:
-            self.driver.quit()
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.shutdown_event.set)
+        
+        self.close_driver()
             
         self.logger.info("FX Service stopped")
 
@@ -292,9 +468,10 @@ def main():
     
     # 포트 설정 (환경변수 또는 기본값)
     port = int(os.environ.get('FX_SERVICE_PORT', '9516'))
+    reuse_port = os.environ.get('FX_SERVICE_REUSEPORT') == '1'
     
     # 서비스 시작
-    service = FXRateService(port=port)
+    service = FXRateService(port=port, reuse_port=reuse_port)
     
     try:
         service.start()
@@ -1,36 +1,193 @@
 #!/usr/bin/env python3
 """
 안정적인 USD/KRW 환율 크롤러
-- 메모리 누수 방지를 위해 주기적으로 드라이버 재시작
+- 미리 띄워둔 드라이버 풀 사용, 메모리 누수 방지를 위해 주기적으로 캐시/쿠키 정리
+- 재시작시 기존 브라우저 세션에 재접속
 - 더 나은 에러 처리
+- investing.com API 우선, 실패시에만 Selenium 사용
 """
 
 import time
-import json
-import os
 import random
+import queue
+import threading
 from datetime import datetime
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.chrome.options import Options
 import logging
 from pathlib import Path
+import requests
+from fx_common import (
+    INVESTING_API_HEADERS, NO_IMAGES_PREFS, RatePublisher, attach_driver_sessions,
+    block_heavy_resources, fetch_investing_chart_rate, parse_rate, save_driver_sessions
+)
 
 # 설정
 TARGET_URL = 'https://kr.investing.com/currencies/usd-krw-chart'
 FX_DATA_FILE = "/tmp/usdkrw_rate.json"
+FX_SESSION_FILE = "/tmp/fx_stable_chrome_session.id"
 LOG_PATH = Path.home() / "kimchi-arbitrage-cpp" / "logs"
 WAIT_TIMEOUT = 5  # 더 짧은 타임아웃
 UPDATE_INTERVAL = 10  # 10초마다 업데이트
-RESTART_INTERVAL = 20  # 20회 업데이트마다 드라이버 재시작
+RESTART_INTERVAL = 20  # 20회 사용한 드라이버는 초기화
+POOL_SIZE = 2  # 미리 띄워둘 드라이버 수
+POOL_ACQUIRE_TIMEOUT = 30  # 드라이버 대기 최대 시간
+POOL_RETRY_INTERVAL = 30  # 드라이버 생성 실패시 재시도 간격
+
+# 환율 요소 선택자 (우선순위 순, 처음 찾은 값 반환)
+EXTRACT_RATE_JS = (
+    'const q = s => document.querySelector(s)?.innerText; '
+    'return q(\'[data-test="instrument-price-last"]\') || q(".text-5xl") || null;'
+)
+
+
+class DriverPool:
+    """미리 띄워둔 크롬 드라이버 풀
+    
+    백그라운드 스레드가 빈 자리를 채우고, 사용측은 acquire/release만 호출
+    max_uses회 사용한 드라이버는 reset 후 재사용, 비정상인 드라이버만 종료하고 새로 채움
+    세션 정보는 session_file에 저장해 프로세스 재시작시 재접속
+    """
+    def __init__(self, factory, reset, size, max_uses, logger, session_file):
+        self.factory = factory
+        self.reset = reset
+        self.size = size
+        self.max_uses = max_uses
+        self.logger = logger
+        self.session_file = session_file
+        
+        self._idle = queue.Queue(maxsize=size)
+        self._stale = queue.Queue()  # reset 대기 드라이버
+        self._uses = {}  # driver -> 사용 횟수
+        self._live = 0  # 생성된 드라이버 수 (대기 + 사용중 + 생성중)
+        self._lock = threading.Lock()
+        self._need_refill = threading.Event()
+        self._need_refill.set()
+        self._running = True
+        
+        # 이전 프로세스가 남긴 브라우저에 재접속 (풀 크기를 넘는 세션은 종료)
+        drivers = attach_driver_sessions(session_file)
+        for driver in drivers[size:]:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        for driver in drivers[:size]:
+            self._live += 1
+            self._add(driver)
+            self.logger.info("Reattached to existing Chrome session")
+        
+        threading.Thread(target=self._refill_loop, daemon=True).start()
+    
+    def _reserve_slot(self):
+        with self._lock:
+            if not self._running or self._live >= self.size:
+                return False
+            self._live += 1
+            return True
+    
+    def _save_sessions(self):
+        with self._lock:
+            drivers = list(self._uses)
+        try:
+            save_driver_sessions(drivers, self.session_file)
+        except Exception as e:
+            self.logger.warning(f"Failed to save driver sessions: {e}")
+    
+    def _add(self, driver):
+        with self._lock:
+            self._uses[driver] = 0
+        self._save_sessions()
+        self._idle.put(driver)
+    
+    def _refill_loop(self):
+        """사용 횟수가 찬 드라이버 reset, 빈 자리는 새로 생성 (사용 경로 밖에서)"""
+        while self._running:
+            self._need_refill.wait(POOL_RETRY_INTERVAL)
+            self._need_refill.clear()
+            
+            while self._running:
+                try:
+                    driver = self._stale.get_nowait()
+                except queue.Empty:
+                    break
+                
+                if self.reset(driver):
+                    self._uses[driver] = 0
+                    self._idle.put(driver)
+                else:
+                    self._discard(driver)
+            
+            while self._reserve_slot():
+                driver = self.factory()
+                if driver is None:
+                    with self._lock:
+                        self._live -= 1
+                    break
+                
+                if not self._running:
+                    self._discard(driver)
+                    break
+                
+                self._add(driver)
+    
+    def acquire(self, timeout=None):
+        """대기중인 드라이버 반환 (timeout 초과시 queue.Empty)"""
+        driver = self._idle.get(timeout=timeout)
+        self._uses[driver] += 1
+        return driver
+    
+    def release(self, driver, reuse=True):
+        """드라이버 반납 (reuse=False면 종료 후 새로 채움, 사용 횟수 초과시 reset)"""
+        if not reuse or not self._running:
+            self._discard(driver)
+        elif self._uses[driver] >= self.max_uses:
+            self._stale.put(driver)
+        else:
+            self._idle.put(driver)
+            return
+        
+        self._need_refill.set()
+    
+    def _discard(self, driver):
+        """드라이버 종료 + 자리 반환"""
+        with self._lock:
+            self._uses.pop(driver, None)
+            self._live -= 1
+        try:
+            driver.quit()
+            self.logger.info("Driver closed")
+        except Exception:
+            pass
+        self._save_sessions()
+    
+    def close(self):
+        """풀 종료 (대기중인 드라이버 모두 종료)"""
+        self._running = False
+        self._need_refill.set()
+        for pending in (self._idle, self._stale):
+            while True:
+                try:
+                    self._discard(pending.get_nowait())
+                except queue.Empty:
+                    break
+
 
 class StableFXCrawler:
     def __init__(self):
         self.logger = self.setup_logging()
-        self.driver = None
+        self.driver = None  # 현재 빌려 쓰는 드라이버
+        self.pool = None  # Selenium이 처음 필요할 때 생성
+        
+        # investing.com API용 HTTP 세션 (keep-alive 재사용)
+        self.session = requests.Session()
+        self.session.headers.update(INVESTING_API_HEADERS)
+        
+        # 환율 공유 메모리 (JSON 파일은 C++ fxrate 호환용으로 백그라운드에서 유지)
+        self.publisher = RatePublisher(FX_DATA_FILE, self.logger)
         
     def setup_logging(self):
         """로깅 설정"""
@@ -47,7 +204,7 @@ class StableFXCrawler:
         return logger
     
     def create_driver(self):
-        """크롬 드라이버 생성"""
+        """크롬 드라이버 생성 + 페이지 로드 (실패시 None)"""
         try:
             options = Options()
             options.add_argument('--headless')
@@ -72,129 +229,130 @@ class StableFXCrawler:
             ]
             options.add_argument(f'user-agent={random.choice(user_agents)}')
             
-            self.driver = webdriver.Chrome(options=options)
-            self.logger.info("Driver created successfully")
-            return True
+            # 이미지 로딩 비활성화
+            options.add_experimental_option('prefs', NO_IMAGES_PREFS)
+            
+            # chromedriver와의 HTTP 연결 재사용
+            driver = webdriver.Chrome(options=options, keep_alive=True)
+            
+            try:
+                # 이미지/폰트/미디어/광고 요청 차단
+                block_heavy_resources(driver)
+                
+                # 페이지 로드
+                driver.get(TARGET_URL)
+                time.sleep(3)  # 페이지 로드 대기
+            except Exception:
+                driver.quit()
+                raise
+            
+            self.logger.info(f"Driver created, loaded page: {TARGET_URL}")
+            return driver
             
         except Exception as e:
             self.logger.error(f"Failed to create driver: {e}")
+            return None
+    
+    def reset_driver(self, driver):
+        """캐시/쿠키 정리 후 페이지 재로드 (실패시 False)"""
+        try:
+            driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+            driver.delete_all_cookies()
+            driver.get(TARGET_URL)
+            time.sleep(3)  # 페이지 로드 대기
+            return True
+        except Exception as e:
+            self.logger.error(f"Failed to reset driver: {e}")
             return False
     
     def extract_rate(self):
-        """여러 방법으로 환율 추출 시도"""
-        methods = [
-            # 방법 1: data-test 속성
-            lambda: self.driver.find_element(By.XPATH, '//*[@data-test="instrument-price-last"]').text,
-            # 방법 2: CSS 선택자
-            lambda: self.driver.find_element(By.CSS_SELECTOR, 'span[data-test="instrument-price-last"]').text,
-            # 방법 3: 클래스 이름으로
-            lambda: self.driver.find_element(By.CLASS_NAME, 'text-5xl').text,
-            # 방법 4: JavaScript 실행
-            lambda: self.driver.execute_script(
-                'return document.querySelector(\'[data-test="instrument-price-last"]\')?.innerText || '
-                'document.querySelector(".text-5xl")?.innerText'
+        """환율 추출 (모든 선택자를 브라우저 안에서 한 번에 시도 - WebDriver 왕복 1회)"""
+        rate_text = self.driver.execute_script(EXTRACT_RATE_JS)
+        if not rate_text:
+            return None
+        
+        rate = parse_rate(rate_text)
+        if rate:
+            self.logger.debug(f"Rate extracted: {rate}")
+        return rate
+    
+    def fetch_rate_http(self):
+        """investing.com API로 환율 조회 (실패시 None)"""
+        try:
+            return fetch_investing_chart_rate(self.session)
+        except (requests.RequestException, KeyError, IndexError, TypeError, ValueError) as e:
+            self.logger.warning(f"Investing API error: {e}")
+            return None
+    
+    def fetch_rate_selenium(self):
+        """Selenium으로 환율 추출 (풀에서 드라이버를 빌려 사용)"""
+        if not self.pool:
+            self.pool = DriverPool(
+                self.create_driver, self.reset_driver, POOL_SIZE, RESTART_INTERVAL,
+                self.logger, FX_SESSION_FILE
             )
-        ]
         
-        for i, method in enumerate(methods):
-            try:
-                rate_text = method()
-                if rate_text:
-                    # 쉼표 제거 및 숫자 변환
-                    rate = float(rate_text.replace(',', '').strip())
-                    if 1000 < rate < 2000:  # 합리적인 범위 확인
-                        self.logger.debug(f"Rate extracted using method {i+1}: {rate}")
-                        return rate
-            except Exception as e:
-                self.logger.debug(f"Method {i+1} failed: {str(e)}")
-                continue
-        
-        return None
-    
-    def save_rate(self, rate):
+        try:
+            self.driver = self.pool.acquire(timeout=POOL_ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            self.logger.warning("No driver available in pool")
+            return None
+        
+        healthy = True
+        try:
+            rate = self.extract_rate()
+            if not rate:
+                self.logger.warning("Failed to extract rate from page")
+                # 실패시 페이지 새로고침 (다음 사용 전까지 로드됨)
+                self.driver.refresh()
+            return rate
+        
+        except WebDriverException as e:
+            healthy = False
+            self.logger.error(f"Driver error: {e}")
+            return None
+        
+        finally:
+            self.pool.release(self.driver, reuse=healthy)
+            self.driver = None
+    
+    def save_rate(self, rate, source):
         """환율 데이터 저장"""
-        data = {
-            "rate": rate,
-            "source": "investing.com (selenium)",
-            "timestamp": datetime.now().isoformat(),
-            "timestamp_unix": time.time()
-        }
-        
-        # 원자적 쓰기
-        tmp_file = f"{FX_DATA_FILE}.tmp"
-        with open(tmp_file, 'w') as f:
-            json.dump(data, f)
-        os.replace(tmp_file, FX_DATA_FILE)
-        
-        self.logger.info(f"Saved rate: {rate}")
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Rate: {rate} KRW/USD")
-    
-    def run_session(self):
-        """하나의 세션 실행 (드라이버 생성부터 종료까지)"""
-        if not self.create_driver():
-            return False
+        data = self.publisher.publish(rate, source)
+        print(f"[{time.strftime('%H:%M:%S', time.localtime(data['timestamp_unix']))}] Rate: {rate} KRW/USD")
+    
+    def run(self):
+        """메인 실행 루프"""
+        self.logger.info("Stable FX Crawler started")
+        print("=== Stable FX Crawler Started ===")
         
         try:
-            # 페이지 로드
-            self.driver.get(TARGET_URL)
-            time.sleep(3)  # 페이지 로드 대기
-            self.logger.info(f"Loaded page: {TARGET_URL}")
-            
-            # 지정된 횟수만큼 업데이트 실행
-            for i in range(RESTART_INTERVAL):
+            while True:
                 try:
-                    rate = self.extract_rate()
+                    rate = self.fetch_rate_http()
+                    source = "investing.com"
+                    if not rate:
+                        rate = self.fetch_rate_selenium()
+                        source = "investing.com (selenium)"
+                    
                     if rate:
-                        self.save_rate(rate)
+                        self.save_rate(rate, source)
                     else:
                         self.logger.warning("Failed to extract rate")
-                        # 실패시 페이지 새로고침
-                        self.driver.refresh()
-                        time.sleep(3)
                     
                     # 대기
                     time.sleep(UPDATE_INTERVAL)
                     
+                except KeyboardInterrupt:
+                    self.logger.info("Crawler stopped by user")
+                    break
                 except Exception as e:
                     self.logger.error(f"Error in update loop: {e}")
                     time.sleep(5)
-            
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Session error: {e}")
-            return False
-            
-        finally:
-            # 드라이버 정리
-            if self.driver:
-                try:
-                    self.driver.quit()
-                    self.logger.info("Driver closed")
-                except:
-                    pass
-                self.driver = None
-    
-    def run(self):
-        """메인 실행 루프"""
-        self.logger.info("Stable FX Crawler started")
-        print("=== Stable FX Crawler Started ===")
         
-        while True:
-            try:
-                # 세션 실행
-                self.run_session()
-                
-                # 재시작 전 대기
-                self.logger.info("Restarting driver for next session")
-                time.sleep(5)
-                
-            except KeyboardInterrupt:
-                self.logger.info("Crawler stopped by user")
-                break
-            except Exception as e:
-                self.logger.error(f"Critical error: {e}")
-                time.sleep(10)
+        finally:
+            if self.pool:
+                self.pool.close()
 
 def main():
     crawler = StableFXCrawler()
@@ -9,24 +9,55 @@ FX 환율 크롤러 워치독
 import time
 import json
 import os
-import subprocess
+import random
+import selectors
+import signal
 import sys
 import logging
 from datetime import datetime, timedelta
 from pathlib import Path
 
+from fx_common import RateShm
+
+# inotify (선택) - 없으면 mtime이 바뀐 경우에만 파일을 다시 읽음
+try:
+    from inotify_simple import INotify, flags
+    INOTIFY_AVAILABLE = True
+except ImportError:
+    INOTIFY_AVAILABLE = False
+
 # 설정
 FX_DATA_FILE = "/tmp/usdkrw_rate.json"
 CRAWLER_SCRIPT = str(Path.home() / "kimchi-arbitrage-cpp" / "scripts" / "fx_selenium_crawler.py")
 LOG_PATH = Path.home() / "kimchi-arbitrage-cpp" / "logs"
 MAX_DATA_AGE_SECONDS = 30  # 30초 이상 오래된 데이터는 문제로 간주
 CHECK_INTERVAL = 10  # 10초마다 체크
+MAX_CHECK_INTERVAL = 300  # 재시작 실패시 체크 간격 최대값
 
 class FXWatchdog:
     def __init__(self):
         self.logger = self.setup_logging()
         self.crawler_pid = None
         
+        # 마지막으로 읽은 데이터 timestamp (파일이 바뀔 때만 갱신)
+        self.data_timestamp = None
+        self.data_mtime = None
+        self.shm = None  # 크롤러가 공유 메모리를 만든 뒤 연결
+        
+        # 크롤러는 tmp 파일 작성 후 rename 하므로 MOVED_TO로 감지
+        # 데이터 변경 알림 + 직접 실행한 크롤러 종료 알림(pidfd)을 한 번에 대기
+        self.selector = selectors.DefaultSelector()
+        self.spawned_pid = None
+        self.spawned_pidfd = None
+        
+        self.inotify = None
+        if INOTIFY_AVAILABLE:
+            self.inotify = INotify()
+            self.inotify.add_watch(os.path.dirname(FX_DATA_FILE), flags.CLOSE_WRITE | flags.MOVED_TO)
+            self.selector.register(self.inotify, selectors.EVENT_READ)
+        
+        self.reload_data()
+        
     def setup_logging(self):
         """로깅 설정"""
         LOG_PATH.mkdir(exist_ok=True)
@@ -46,71 +77,177 @@ class FXWatchdog:
         
         return logger
     
+    def find_processes(self, name, field='cmdline'):
+        """/proc를 직접 읽어 field(cmdline 또는 comm)에 name이 포함된 PID 목록 반환 (pgrep 대체)"""
+        needle = name.encode()
+        own_pid = os.getpid()
+        pids = []
+        
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            
+            pid = int(entry)
+            if pid == own_pid:
+                continue
+            
+            try:
+                with open(f'/proc/{entry}/{field}', 'rb') as f:
+                    if needle in f.read():
+                        pids.append(pid)
+            except OSError:
+                continue  # 이미 종료된 프로세스
+        
+        return pids
+    
+    def kill_processes(self, pids, sig=signal.SIGTERM):
+        """PID 목록에 시그널 전송 (pkill 대체)"""
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except (ProcessLookupError, PermissionError):
+                continue
+    
     def is_crawler_running(self):
         """크롤러가 실행 중인지 확인"""
         try:
-            result = subprocess.run(
-                ['pgrep', '-f', 'fx_selenium_crawler.py'],
-                capture_output=True,
-                text=True
-            )
-            if result.stdout.strip():
-                pids = result.stdout.strip().split('\n')
-                self.crawler_pid = int(pids[0])
+            pids = self.find_processes('fx_selenium_crawler.py')
+            if pids:
+                self.crawler_pid = pids[0]
                 return True
             return False
         except Exception as e:
             self.logger.error(f"Failed to check crawler status: {e}")
             return False
     
-    def check_data_freshness(self):
-        """데이터의 최신성 확인"""
+    def reload_data(self):
+        """데이터 파일을 읽어 timestamp 갱신"""
         try:
-            if not os.path.exists(FX_DATA_FILE):
-                self.logger.warning("FX data file not found")
-                return False, None
-            
             with open(FX_DATA_FILE, 'r') as f:
                 data = json.load(f)
+            self.data_timestamp = data.get('timestamp_unix', 0)
+        except FileNotFoundError:
+            self.data_timestamp = None
+        except Exception as e:
+            self.logger.error(f"Failed to read data: {e}")
+    
+    def poll_data_file(self):
+        """inotify가 없을 때 - mtime이 바뀐 경우에만 다시 읽음"""
+        try:
+            mtime = os.stat(FX_DATA_FILE).st_mtime_ns
+        except FileNotFoundError:
+            self.data_timestamp = self.data_mtime = None
+            return
+        
+        if mtime != self.data_mtime:
+            self.data_mtime = mtime
+            self.reload_data()
+    
+    def wait_for_updates(self, timeout):
+        """timeout 동안 대기 - 데이터 파일이 바뀌면 다시 읽고, 크롤러가 종료되면 바로 반환"""
+        data_name = os.path.basename(FX_DATA_FILE)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
             
-            timestamp_unix = data.get('timestamp_unix', 0)
-            current_time = time.time()
-            age = current_time - timestamp_unix
-            
-            if age > MAX_DATA_AGE_SECONDS:
-                self.logger.warning(f"Data is {age:.1f} seconds old (limit: {MAX_DATA_AGE_SECONDS}s)")
-                return False, age
-            
-            return True, age
+            if not self.selector.get_map():
+                time.sleep(remaining)
+                return
             
-        except Exception as e:
-            self.logger.error(f"Failed to check data: {e}")
+            for key, _ in self.selector.select(remaining):
+                if key.fileobj is self.inotify:
+                    if any(event.name == data_name for event in self.inotify.read(timeout=0)):
+                        self.reload_data()
+                else:
+                    self.reap_crawler()
+                    self.logger.warning("Crawler process exited")
+                    return
+    
+    def spawn_crawler(self):
+        """쉘 없이 크롤러 실행 (nohup 대신 새 세션, 출력은 로그 파일로)"""
+        out_file = str(LOG_PATH / 'fx_selenium.out')
+        pid = os.posix_spawnp('python3', ['python3', CRAWLER_SCRIPT], os.environ, file_actions=[
+            (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+            (os.POSIX_SPAWN_OPEN, 1, out_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644),
+            (os.POSIX_SPAWN_DUP2, 1, 2)
+        ], setsid=True)
+        self.spawned_pid = pid
+        
+        # pidfd로 종료를 이벤트로 받음 (Linux 5.3+, 없으면 주기적 확인만)
+        try:
+            self.spawned_pidfd = os.pidfd_open(pid)
+            self.selector.register(self.spawned_pidfd, selectors.EVENT_READ)
+        except (AttributeError, OSError):
+            self.spawned_pidfd = None
+        
+        return pid
+    
+    def reap_crawler(self):
+        """직접 실행한 크롤러 회수 (좀비 방지) + pidfd 정리"""
+        if self.spawned_pidfd is not None:
+            self.selector.unregister(self.spawned_pidfd)
+            os.close(self.spawned_pidfd)
+            self.spawned_pidfd = None
+        
+        if self.spawned_pid:
+            try:
+                os.waitpid(self.spawned_pid, os.WNOHANG)
+            except ChildProcessError:
+                pass
+            self.spawned_pid = None
+    
+    def read_shm_timestamp(self):
+        """공유 메모리의 최신 timestamp (연결 후에는 시스템 콜 없이 읽음), 없으면 None"""
+        if not self.shm:
+            try:
+                self.shm = RateShm()
+            except (OSError, ValueError):
+                # 없는 파일 또는 writer가 ftruncate 전이라 크기가 0인 파일 (다음 확인에서 재시도)
+                return None
+        
+        snapshot = self.shm.read()
+        return snapshot[1] if snapshot else None
+    
+    def check_data_freshness(self):
+        """데이터의 최신성 확인 (메모리의 timestamp 기준, 크롤러가 멈추면 나이가 계속 증가)"""
+        # 공유 메모리가 최신이면 파일은 확인하지 않음
+        timestamp = self.read_shm_timestamp()
+        if timestamp is None or time.time() - timestamp > MAX_DATA_AGE_SECONDS:
+            if not self.inotify:
+                self.poll_data_file()
+            if self.data_timestamp is not None:
+                timestamp = max(timestamp or 0, self.data_timestamp)
+        
+        if timestamp is None:
+            self.logger.warning("FX data file not found")
             return False, None
+        
+        age = time.time() - timestamp
+        
+        if age > MAX_DATA_AGE_SECONDS:
+            self.logger.warning(f"Data is {age:.1f} seconds old (limit: {MAX_DATA_AGE_SECONDS}s)")
+            return False, age
+        
+        return True, age
     
     def start_crawler(self):
         """크롤러 시작"""
         try:
             # 기존 프로세스 종료
-            subprocess.run(['pkill', '-f', 'fx_selenium_crawler.py'], stderr=subprocess.DEVNULL)
+            self.kill_processes(self.find_processes('fx_selenium_crawler.py'))
             time.sleep(2)
             
-            # 크롬 프로세스 정리
-            subprocess.run(['pkill', 'chrome'], stderr=subprocess.DEVNULL)
+            # 크롬 프로세스 정리 (pkill chrome과 같이 프로세스 이름으로 매칭)
+            self.kill_processes(self.find_processes('chrome', field='comm'))
             time.sleep(1)
             
-            # 크롤러 시작
-            cmd = [
-                'nohup',
-                'python3',
-                CRAWLER_SCRIPT,
-                '>', str(LOG_PATH / 'fx_selenium.out'),
-                '2>&1',
-                '&'
-            ]
+            # 이전에 직접 실행한 크롤러 회수
+            self.reap_crawler()
             
-            # 쉘 명령으로 실행
-            shell_cmd = f"nohup python3 {CRAWLER_SCRIPT} > {LOG_PATH}/fx_selenium.out 2>&1 &"
-            subprocess.Popen(shell_cmd, shell=True)
+            # 크롤러 시작
+            self.spawn_crawler()
             
             time.sleep(5)  # 시작 대기
             
@@ -135,6 +272,7 @@ class FXWatchdog:
         print("=====================================\n")
         
         consecutive_failures = 0
+        check_delay = CHECK_INTERVAL
         
         while True:
             try:
@@ -171,17 +309,21 @@ class FXWatchdog:
                         need_restart = True
                 else:
                     consecutive_failures = 0
+                    check_delay = CHECK_INTERVAL
                 
                 if need_restart:
                     self.logger.info("Restarting crawler...")
                     if self.start_crawler():
                         consecutive_failures = 0
+                        check_delay = CHECK_INTERVAL
                         print("✅ 크롤러 재시작 성공")
                     else:
-                        print("❌ 크롤러 재시작 실패")
+                        # 재시작 실패 - 체크 간격을 늘려 반복 재시작 방지
+                        check_delay = min(MAX_CHECK_INTERVAL, check_delay * 2 + random.random())
+                        print(f"❌ 크롤러 재시작 실패 ({check_delay:.0f}초 후 재시도)")
                 
-                # 대기
-                time.sleep(CHECK_INTERVAL)
+                # 대기 (데이터 변경 알림 처리)
+                self.wait_for_updates(check_delay)
                 
             except KeyboardInterrupt:
                 self.logger.info("Watchdog stopped by user")
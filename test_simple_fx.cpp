@@ -20,7 +20,7 @@ int main() {
             
             if (rate_pos != std::string::npos && source_pos != std::string::npos) {
                 // rate 추출
-                size_t rate_start = rate_pos + 8;  // "rate": 다음
+                size_t rate_start = rate_pos + 7;  // "rate": 다음 (공백 유무 모두 처리)
                 while (rate_start < content.length() && content[rate_start] == ' ') rate_start++;
                 size_t rate_end = content.find(",", rate_start);
                 std::string rate_str = content.substr(rate_start, rate_end - rate_start);